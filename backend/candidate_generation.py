@@ -1,8 +1,10 @@
-from scipy.spatial import Voronoi, Delaunay
+import functools
+
+from scipy.spatial import Voronoi, Delaunay, cKDTree
 import pandas as pd
+import numba
 
-from shapely.geometry import Point
-from shapely.wkt import loads
+import shapely
 
 from utils import *
 
@@ -12,6 +14,79 @@ MIN_DIST_TO_TERMINAL = 8.0,
 MAX_CIRCUMRADIUS = 300.0
 MIN_CANDIDATE_SEPARATION = 10.0
 
+# Grid-cell key type for the typed dict used by the separation filter
+_CELL_KEY_TYPE = numba.types.UniTuple(numba.types.int64, 2)
+
+
+@numba.njit(cache=True)
+def _grid_separation_mask(ym: np.ndarray, xm: np.ndarray, min_sep_m: float) -> np.ndarray:
+    """
+    Greedy minimum-separation filter via spatial hashing: keep each point only
+    if it is at least `min_sep_m` meters from every previously kept one.
+
+    Points are given in local projected meters and snapped to a uniform grid
+    of `min_sep_m` cells, so each new point only checks kept points in its
+    3×3 cell neighborhood — O(K) amortized instead of the O(K²) all-pairs
+    scan. Kept points per cell are chained through a `nxt` linked-list array.
+
+    Args:
+        ym: (n,) y coordinates in meters (projected)
+        xm: (n,) x coordinates in meters (projected)
+        min_sep_m: minimum allowed separation in meters
+
+    Returns:
+        np.ndarray: boolean keep-mask of shape (n,)
+    """
+    n = ym.shape[0]
+    keep = np.zeros(n, dtype=np.bool_)
+    min_sep_sq = min_sep_m * min_sep_m
+
+    head = numba.typed.Dict.empty(
+        key_type=_CELL_KEY_TYPE,
+        value_type=numba.types.int64,
+    )
+    nxt = np.full(n, -1, dtype=np.int64)
+
+    for i in range(n):
+        gy = np.int64(math.floor(ym[i] / min_sep_m))
+        gx = np.int64(math.floor(xm[i] / min_sep_m))
+        ok = True
+        for dy in range(-1, 2):
+            for dx in range(-1, 2):
+                key = (gy + dy, gx + dx)
+                if key in head:
+                    j = head[key]
+                    while j != -1:
+                        ddy = ym[i] - ym[j]
+                        ddx = xm[i] - xm[j]
+                        if ddy * ddy + ddx * ddx < min_sep_sq:
+                            ok = False
+                            break
+                        j = nxt[j]
+                if not ok:
+                    break
+            if not ok:
+                break
+        if ok:
+            keep[i] = True
+            cell = (gy, gx)
+            if cell in head:
+                nxt[i] = head[cell]
+            head[cell] = i
+
+    return keep
+
+
+def _enforce_min_separation(candidates: np.ndarray, min_sep_m: float) -> np.ndarray:
+    """Apply the grid-hashed greedy separation filter to [lat, lon] candidates."""
+    proj = project_to_meters(candidates)
+    keep = _grid_separation_mask(
+        np.ascontiguousarray(proj[:, 0], dtype=np.float64),
+        np.ascontiguousarray(proj[:, 1], dtype=np.float64),
+        min_sep_m,
+    )
+    return candidates[keep]
+
 
 def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
     """
@@ -19,18 +94,21 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
     Final step: removes candidates closer than MIN_CANDIDATE_SEPARATION meters.
     """
     if len(coords) < 3:
-        return np.empty((0, 2), dtype=float)
+        return np.empty((0, 2), dtype=np.float32)
 
     vor = Voronoi(coords)
     if len(vor.vertices) == 0:
-        return np.empty((0, 2), dtype=float)
+        return np.empty((0, 2), dtype=np.float32)
 
     verts = vor.vertices  # shape (n_vertices, 2)
 
-    # Vectorized haversine distances from vertices to original points
-    dists = haversine_vec(verts, coords)  # assume you have this function
+    # KD-tree on projected meters: only the 3 nearest terminals per vertex
+    # are needed, so skip the full (V, N) haversine matrix. Both arrays must
+    # share one projection reference for distances to be comparable.
+    ref = coords.mean(axis=0)
+    tree = cKDTree(project_to_meters(coords, ref))
+    nearest_dists, _ = tree.query(project_to_meters(verts, ref), k=3)
 
-    nearest_dists = np.partition(dists, 2, axis=1)[:, :3]
     min_dists = nearest_dists[:, 0]
     third_min_dists = nearest_dists[:, 2]
 
@@ -43,14 +121,14 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
 
     if len(candidates) == 0:
         print("No Voronoi candidates after initial filtering")
-        return candidates
+        return candidates.astype(np.float32)
 
     # ─── Step 1: Deduplicate with rounding (existing) ───────────────────────
     candidates = np.unique(np.round(candidates, decimals=6), axis=0)
 
     if len(candidates) <= 1:
         print(f"Generated {len(candidates)} unique Voronoi candidate poles")
-        return candidates
+        return candidates.astype(np.float32)
 
     # ─── Step 2: Enforce minimum separation (new) ───────────────────────────
     # Sort by latitude for somewhat spatial order (helps greedy algorithm)
@@ -58,23 +136,7 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
     candidates = candidates[sort_idx]
 
     # Greedy filter: keep point only if >= MIN distance from all kept points
-    kept = []
-    kept_array = np.empty((0, 2))
-
-    for pt in candidates:
-        if len(kept_array) == 0:
-            kept.append(pt)
-            kept_array = np.array([pt])
-            continue
-
-        # Compute distances to already kept points
-        dists_to_kept = haversine_vec(np.array([pt]), kept_array)[0]
-
-        if np.all(dists_to_kept >= MIN_CANDIDATE_SEPARATION):
-            kept.append(pt)
-            kept_array = np.vstack([kept_array, pt])
-
-    candidates = np.array(kept)
+    candidates = _enforce_min_separation(candidates, MIN_CANDIDATE_SEPARATION).astype(np.float32)
 
     print(f"Generated {len(candidates)} Voronoi candidate poles "
           f"after min {MIN_CANDIDATE_SEPARATION}m separation filter "
@@ -83,38 +145,47 @@ def generate_voronoi_candidates(coords: np.ndarray) -> np.ndarray:
     return candidates
 
 
-def fermat_torricelli_point(pts: np.ndarray) -> np.ndarray:
+def fermat_torricelli_points(triangles: np.ndarray) -> np.ndarray:
     """
-    Compute approximate Fermat-Torricelli point for a triangle (3 points).
-    If any angle ≥ 120°, returns the vertex with that angle.
+    Compute approximate Fermat-Torricelli points for a batch of triangles.
+    For any triangle with an angle ≥ 120°, returns the vertex at that angle.
     Otherwise returns a rough approximation (centroid fallback for simplicity).
-    """
-    if len(pts) != 3:
-        raise ValueError("Need exactly 3 points")
 
-    A, B, C = pts
+    All triangles are handled at once with broadcast arithmetic — no
+    per-triangle Python dispatch or temporary allocation churn.
 
-    # Compute side lengths
-    a = np.linalg.norm(B - C)
-    b = np.linalg.norm(A - C)
-    c = np.linalg.norm(A - B)
-
-    # Cosines of angles
-    cosA = (b**2 + c**2 - a**2) / (2 * b * c) if b * c != 0 else 1
-    cosB = (a**2 + c**2 - b**2) / (2 * a * c) if a * c != 0 else 1
-    cosC = (a**2 + b**2 - c**2) / (2 * a * b) if a * b != 0 else 1
-
-    # If any angle ≥ 120° (cos ≤ -0.5), minimum is at that vertex
-    if cosA <= -0.5:
-        return A
-    if cosB <= -0.5:
-        return B
-    if cosC <= -0.5:
-        return C
+    Args:
+        triangles: (m, 3, 2) array of triangle vertices
 
-    # Otherwise: simple centroid approximation (good enough for our purpose)
-    # (Real 120° construction is more involved — this is fast & reasonable)
-    return np.mean(pts, axis=0)
+    Returns:
+        np.ndarray: (m, 2) array of approximate Fermat points
+    """
+    A, B, C = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+
+    # Side lengths, per triangle
+    a = np.linalg.norm(B - C, axis=1)
+    b = np.linalg.norm(A - C, axis=1)
+    c = np.linalg.norm(A - B, axis=1)
+
+    # Cosines of angles; degenerate (zero-length) sides fall back to cos = 1
+    def _cos(opp, s1, s2):
+        denom = 2 * s1 * s2
+        out = np.ones_like(denom)
+        np.divide(s1**2 + s2**2 - opp**2, denom, out=out, where=denom != 0)
+        return out
+
+    cosA = _cos(a, b, c)
+    cosB = _cos(b, a, c)
+    cosC = _cos(c, a, b)
+
+    # If any angle ≥ 120° (cos ≤ -0.5), minimum is at that vertex;
+    # otherwise: simple centroid approximation (good enough for our purpose)
+    centroid = triangles.mean(axis=1)
+    return np.where(
+        (cosA <= -0.5)[:, None], A,
+        np.where((cosB <= -0.5)[:, None], B,
+                 np.where((cosC <= -0.5)[:, None], C, centroid))
+    )
 
 
 def generate_fermat_candidates(coords: np.ndarray, max_candidates: int = 30) -> np.ndarray:
@@ -130,25 +201,17 @@ def generate_fermat_candidates(coords: np.ndarray, max_candidates: int = 30) ->
         np.ndarray: candidate points (m, 2)
     """
     if len(coords) < 3:
-        return np.empty((0, 2), dtype=float)
+        return np.empty((0, 2), dtype=np.float32)
 
     # Compute Delaunay triangulation
     tri = Delaunay(coords)
 
-    candidates = []
+    if len(tri.simplices) == 0:
+        return np.empty((0, 2), dtype=np.float32)
 
-    for simplex in tri.simplices:
-        if len(candidates) >= max_candidates:
-            break
-        pts = coords[simplex]
-        # Get approximate Steiner/Fermat point for this triangle
-        st_pt = fermat_torricelli_point(pts)
-        candidates.append(st_pt)
-
-    if not candidates:
-        return np.empty((0, 2), dtype=float)
-
-    candidates = np.array(candidates)
+    # Approximate Steiner/Fermat points for all triangles in one batch
+    simplices = tri.simplices[:max_candidates]
+    candidates = fermat_torricelli_points(coords[simplices]).astype(np.float32)
 
     # Optional: apply your existing separation filter
     # (you can reuse the same greedy logic from generate_voronoi_candidates)
@@ -156,21 +219,7 @@ def generate_fermat_candidates(coords: np.ndarray, max_candidates: int = 30) ->
         sort_idx = np.argsort(candidates[:, 0])
         candidates = candidates[sort_idx]
 
-        kept = []
-        kept_array = np.empty((0, 2))
-
-        for pt in candidates:
-            if len(kept_array) == 0:
-                kept.append(pt)
-                kept_array = np.array([pt])
-                continue
-
-            dists_to_kept = haversine_vec(np.array([pt]), kept_array)[0]
-            if np.all(dists_to_kept >= MIN_CANDIDATE_SEPARATION):
-                kept.append(pt)
-                kept_array = np.vstack([kept_array, pt])
-
-        candidates = np.array(kept)
+        candidates = _enforce_min_separation(candidates, MIN_CANDIDATE_SEPARATION)
 
     print(f"Generated {len(candidates)} Fermat-Steiner candidate poles "
           f"(limited to {max_candidates}, after min separation filter)")
@@ -178,6 +227,36 @@ def generate_fermat_candidates(coords: np.ndarray, max_candidates: int = 30) ->
     return candidates
 
 
+@functools.lru_cache(maxsize=1)
+def _load_buildings():
+    """
+    Load and parse the buildings dataset once per process.
+
+    Reading the CSV and parsing every WKT polygon is pure constant cost, so it
+    is done lazily on first use and cached. Rows are sorted by centroid
+    latitude so callers can bbox-filter with np.searchsorted instead of a
+    full scan.
+
+    Returns:
+        dict: {'lat': (B,) float array, 'lon': (B,) float array,
+               'poly': (B,) object array of valid shapely polygons},
+              all sorted by 'lat'
+    """
+    df = pd.read_csv("179_buildings.csv", usecols=['latitude', 'longitude', 'geometry'])
+    df = df.dropna(subset=['latitude', 'longitude', 'geometry'])
+
+    # shapely 2.x parses and validates whole arrays in C (GIL released)
+    polys = shapely.from_wkt(df['geometry'].to_numpy(), on_invalid="ignore")
+    valid = shapely.is_valid(polys)  # False for both invalid and unparseable rows
+
+    lat = df['latitude'].to_numpy()[valid]
+    lon = df['longitude'].to_numpy()[valid]
+    polys = polys[valid]
+
+    order = np.argsort(lat)
+    return {'lat': lat[order], 'lon': lon[order], 'poly': polys[order]}
+
+
 def filter_candidates_by_buildings(
         candidates: Union[np.ndarray, list[tuple[float, float]]],
         coords: Union[np.ndarray, list[tuple[float, float]]],
@@ -214,57 +293,48 @@ def filter_candidates_by_buildings(
           f"lat [{min_lat:.8f}, {max_lat:.8f}], "
           f"lon [{min_lon:.8f}, {max_lon:.8f}]")
 
-    # ─── 2. Load CSV and filter buildings by centroid inside bbox ────────
-    df = pd.read_csv("179_buildings.csv", usecols=['latitude', 'longitude', 'geometry'])
+    # ─── 2. Filter cached buildings by centroid inside bbox ──────────────
+    buildings = _load_buildings()
 
-    # Drop rows missing required columns
-    df = df.dropna(subset=['latitude', 'longitude', 'geometry'])
+    # Latitudes are pre-sorted, so the lat range is a binary search; only the
+    # longitudes inside that slice need a mask.
+    lo = np.searchsorted(buildings['lat'], min_lat, side='left')
+    hi = np.searchsorted(buildings['lat'], max_lat, side='right')
+    lon_slice = buildings['lon'][lo:hi]
+    lon_mask = (lon_slice >= min_lon) & (lon_slice <= max_lon)
 
-    # Keep only buildings whose centroid is inside the bbox
-    inside_mask = (
-            (df['latitude'] >= min_lat) & (df['latitude'] <= max_lat) &
-            (df['longitude'] >= min_lon) & (df['longitude'] <= max_lon)
-    )
+    polygons = buildings['poly'][lo:hi][lon_mask]
 
-    df_filtered = df[inside_mask].copy()
-
-    if df_filtered.empty:
+    if len(polygons) == 0:
         print("No building centroids inside coords bbox → all candidates kept")
         return candidates
 
-    print(f"Found {len(df_filtered)} buildings with centroid inside bbox")
-
-    # ─── 3. Parse geometry for the filtered buildings only ───────────────
-    df_filtered['poly'] = df_filtered['geometry'].apply(loads)
-
-    # Drop invalid geometries
-    df_filtered = df_filtered[df_filtered['poly'].apply(lambda g: g.is_valid if g else False)]
+    print(f"Found {len(polygons)} buildings with centroid inside bbox")
 
-    if df_filtered.empty:
-        print("No valid building polygons after filtering → all candidates kept")
-        return candidates
+    # ─── 3. Remove candidates inside any remaining building polygon ──────
 
-    # ─── 4. Remove candidates inside any remaining building polygon ──────
-    polygons = df_filtered['poly'].values
+    candidates = np.asarray(candidates, dtype=float)
 
-    def is_covered(lat: float, lon: float) -> bool:
-        pt = Point(lon, lat)  # shapely uses (x=lon, y=lat)
-        for poly in polygons:
-            if poly.contains(pt):
-                return True
-        return False
+    # STRtree + vectorized predicate: one C-level query instead of a
+    # Python contains() call per candidate × building pair.
+    tree = shapely.STRtree(polygons)
+    pts = shapely.points(candidates[:, 1], candidates[:, 0])  # shapely uses (x=lon, y=lat)
+    hits = tree.query(pts, predicate="covered_by")
 
-    # Vectorized-ish check (still loop, but only over relevant buildings)
     keep_mask = np.ones(len(candidates), dtype=bool)
-    for i, (lat, lon) in enumerate(candidates):
-        if is_covered(lat, lon):
-            keep_mask[i] = False
+    keep_mask[np.unique(hits[0])] = False
 
     filtered = candidates[keep_mask]
 
     removed = len(candidates) - len(filtered)
-    removed_nodes = [c for c in candidates if c not in filtered]
     if removed > 0:
-        print(f"Removed {removed} candidates inside building footprints: {removed_nodes}")
+        print(f"Removed {removed} candidates inside building footprints: "
+              f"{candidates[~keep_mask].tolist()}")
 
     return filtered
+
+
+# Touch the JIT kernel at import so compiling (or loading the on-disk cache
+# from cache=True) happens during worker startup rather than on the first
+# request a cold worker serves.
+_grid_separation_mask(np.zeros(1), np.zeros(1), 1.0)
@@ -1,6 +1,4 @@
 # backend/mst.py
-from scipy.spatial.distance import cdist
-
 from candidate_generation import *
 from build_graph import *
 
@@ -41,21 +39,24 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
         pole_start_idx = len(coords)
 
     # ─── Build & compute MST ────────────────────────────────────────────────
-    dist_matrix = cdist(
-        extended_coords,
-        extended_coords,
-        metric=lambda u, v: haversine_meters(u[0], u[1], v[0], v[1])
-    )
+    # Only pairs within MAX_POLE_TO_POLE meters can ever become edges, so ask
+    # a KD-tree for exactly those instead of materializing the dense N×N
+    # distance matrix — O(N log N + E) where E << N². Distances for the
+    # surviving pairs are haversine, computed element-wise in one pass.
+    tree = cKDTree(project_to_meters(extended_coords))
+    pairs = tree.query_pairs(r=MAX_POLE_TO_POLE, output_type="ndarray")
+    pair_dists = haversine_pairs(extended_coords[pairs[:, 0]], extended_coords[pairs[:, 1]])
 
     DG = build_directed_graph_for_arborescence(
         source_idx=source_idx,
         terminal_indices=terminal_indices,
         pole_indices=pole_indices,
-        dist_matrix=dist_matrix,  # you already compute this
+        pair_indices=pairs,
+        pair_dists=pair_dists,
         costs=costs,
     )
 
-    arbo = nx.minimum_spanning_arborescence(DG, attr="weight", preserve_attrs=True, default=1e18)
+    arbo = compute_min_arborescence(DG, source_idx)
 
     # ─── Remove 0 degree poles ────────────────────────────────────────────────
     mst = prune_dead_end_pole_branches(arbo, pole_indices, terminal_indices)
@@ -69,11 +70,23 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
         node_names[pole_i] = f"Pole {idx}"
 
     # ─── Collect edges & totals ─────────────────────────────────────────────
-    edges = []
-    total_low_m = 0.0
-    total_high_m = 0.0
+    edge_list = list(mst.edges(data=True))
+
+    # Group-sum lengths by voltage class in one vectorized pass; the per-edge
+    # dict build below is kept separate (the API contract needs it anyway).
+    lengths = np.fromiter(
+        (data["length"] for _, _, data in edge_list),
+        dtype=np.float64, count=len(edge_list),
+    )
+    is_low = np.fromiter(
+        (data["voltage"] == "low" for _, _, data in edge_list),
+        dtype=bool, count=len(edge_list),
+    )
+    total_low_m = float(lengths[is_low].sum())
+    total_high_m = float(lengths[~is_low].sum())
 
-    for u, v, data in mst.edges(data=True):
+    edges = []
+    for u, v, data in edge_list:
         length_m = data.get("length")
         voltage = data.get("voltage")
 
@@ -95,11 +108,6 @@ def compute_mst(request: OptimizationRequest) -> Dict[str, Any]:
             "voltage": voltage,
         })
 
-        if voltage == "low":
-            total_low_m += length_m
-        else:
-            total_high_m += length_m
-
     # ─── Cost calculation ───────────────────────────────────────────────────
     pole_cost = float(costs.get("poleCost", 1500.0))
     low_cost_m = float(costs.get("lowVoltageCostPerMeter", 8.0))
@@ -1,9 +1,19 @@
 import math
+import re
+
 import numpy as np
 from typing import Dict, Union, Any, List
 
 from pydantic import BaseModel
 
+# Names that mark a point as the power source (matched case-insensitively,
+# anywhere in the name). One compiled pattern instead of a keyword scan per
+# point — parse_input sits on every request's critical path.
+_SOURCE_RE = re.compile(
+    r"power\s*source|substation|main\s*source|primary|generator|grid\s*tie|utility|source",
+    re.IGNORECASE,
+)
+
 
 class OptimizationRequest(BaseModel):
     """Pydantic model for incoming optimization request from frontend.
@@ -41,42 +51,44 @@ def parse_input(request: OptimizationRequest):
     if len(points) < 2:
         raise ValueError("At least 2 points required")
 
-    coords_list = []
+    # Write straight into the final float32 buffer — no intermediate Python
+    # list or second copy on conversion.
+    coords = np.empty((len(points), 2), dtype=np.float32)
     names = []
     source_idx = None
 
-    SOURCE_KEYWORDS = {
-        "power source", "powersource", "source", "substation", "main source",
-        "primary", "generator", "grid tie", "utility"
-    }
-
     for i, p in enumerate(points):
         try:
-            lat = float(p["lat"])
-            lng = float(p["lng"])
+            coords[i, 0] = float(p["lat"])
+            coords[i, 1] = float(p["lng"])
         except (KeyError, TypeError, ValueError) as e:
             raise ValueError(f"Point {i + 1} missing/invalid lat/lng: {p}") from e
 
-        if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
-            raise ValueError(f"Point {i + 1} has invalid coordinates: ({lat}, {lng})")
-
-        coords_list.append([lat, lng])
-
         # Name handling
         raw_name = p.get("name")
         name = str(raw_name).strip() if raw_name is not None else f"Location {i + 1}"
         names.append(name)
 
         # Source detection (case-insensitive, more flexible)
-        name_lower = name.lower()
-        if any(kw in name_lower for kw in SOURCE_KEYWORDS) or "source" in name_lower:
+        if _SOURCE_RE.search(name):
             if source_idx is not None:
                 print(f"Warning: Multiple potential sources detected; using first (index {source_idx})")
             else:
                 source_idx = i
                 names[i] = "Power Source"  # canonical name
 
-    coords = np.array(coords_list, dtype=np.float64)
+    # Range check vectorized over the whole buffer; non-finite values (NaN
+    # compares False against the bounds) are invalid too
+    invalid = (
+            ~np.isfinite(coords).all(axis=1) |
+            (coords[:, 0] < -90) | (coords[:, 0] > 90) |
+            (coords[:, 1] < -180) | (coords[:, 1] > 180)
+    )
+    if invalid.any():
+        i = int(np.argmax(invalid))
+        raise ValueError(
+            f"Point {i + 1} has invalid coordinates: ({coords[i, 0]}, {coords[i, 1]})"
+        )
 
     if source_idx is None:
         print("No explicit power source found → using first point (index 0)")
@@ -113,15 +125,57 @@ def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> floa
     return R * c
 
 
-def haversine_vec(A, B):
-    # A, B: (n, 2) arrays of [lat, lon]
-    lat1, lon1 = np.radians(A[:, 0]), np.radians(A[:, 1])
-    lat2, lon2 = np.radians(B[:, 0]), np.radians(B[:, 1])
+def haversine_vec_rad(lat1, lon1, lat2, lon2, cos_lat1, cos_lat2):
+    # Radian-space haversine: all inputs are 1-D arrays already converted to
+    # radians (with cosines precomputed), so repeated callers pay the trig
+    # conversion once per array instead of once per call.
+    # Returns the (|lat1|, |lat2|) matrix of meters.
     dlat = lat2 - lat1[:, None]
     dlon = lon2 - lon1[:, None]
-    a = np.sin(dlat / 2) ** 2 + np.cos(lat1[:, None]) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    a = np.sin(dlat / 2) ** 2 + cos_lat1[:, None] * cos_lat2 * np.sin(dlon / 2) ** 2
     c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return 6371000 * c  # shape (n_candidates, n_buildings)
+    return 6371000 * c
+
+
+def haversine_vec(A, B):
+    # A, B: (n, 2) and (m, 2) arrays of [lat, lon] degrees → (n, m) meters.
+    lat1, lon1 = np.radians(A[:, 0]), np.radians(A[:, 1])
+    lat2, lon2 = np.radians(B[:, 0]), np.radians(B[:, 1])
+    return haversine_vec_rad(lat1, lon1, lat2, lon2, np.cos(lat1), np.cos(lat2))
+
+
+def haversine_pairs(A, B):
+    # Element-wise haversine between row-aligned (n, 2) [lat, lon] degree
+    # arrays → (n,) meters. For sparse pair lists where the full outer matrix
+    # of haversine_vec would be wasted.
+    lat1, lon1 = np.radians(A[:, 0]), np.radians(A[:, 1])
+    lat2, lon2 = np.radians(B[:, 0]), np.radians(B[:, 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def project_to_meters(coords, ref=None):
+    """Project [lat, lon] degrees to local equirectangular meters.
+
+    Accurate to well under 0.1% at neighborhood scale (a few km), which lets
+    nearest-neighbor structures use plain Euclidean distance instead of
+    haversine.
+
+    Args:
+        coords: (n, 2) array of [lat, lon] in degrees.
+        ref: optional [lat, lon] reference point; defaults to the centroid.
+
+    Returns:
+        np.ndarray: (n, 2) array of [y_m, x_m] meters relative to ref.
+    """
+    coords = np.asarray(coords)
+    if ref is None:
+        ref = coords.mean(axis=0)
+
+    R = 6371000.0
+    y = np.radians(coords[:, 0] - ref[0]) * R
+    x = np.radians(coords[:, 1] - ref[1]) * R * np.cos(np.radians(ref[0]))
+    return np.column_stack([y, x])
 
 
 def build_bounding_box(coords):